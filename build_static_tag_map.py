@@ -0,0 +1,48 @@
+"""
+Regenerate static_tag_map.py from pycountry.
+
+evaluate.py maps CommonLID ISO 639-3 tags to spirit-guess codes through the
+precomputed STATIC_TAG_MAP, so pycountry is only needed to rebuild it (e.g.
+after adding codes to SPIRIT_GUESS_CODES or upgrading pycountry).
+
+Usage:
+    python build_static_tag_map.py
+"""
+
+import pycountry
+
+from language_codes import SPIRIT_GUESS_CODES
+
+OUTPUT_PATH = "static_tag_map.py"
+
+
+def main():
+    entries = sorted(
+        (lang.alpha_3, lang.alpha_2, lang.name)
+        for lang in pycountry.languages
+        if getattr(lang, "alpha_2", None) in SPIRIT_GUESS_CODES
+    )
+
+    lines = [
+        '"""',
+        "ISO 639-3 → spirit-guess code for every language pycountry resolves to a",
+        "code in SPIRIT_GUESS_CODES.",
+        "",
+        f"Generated by build_static_tag_map.py (pycountry {pycountry.__version__});",
+        "do not edit by hand.",
+        '"""',
+        "",
+        "from types import MappingProxyType",
+        "",
+        "STATIC_TAG_MAP = MappingProxyType({",
+    ]
+    lines += [f'    "{a3}": "{a2}",  # {name}' for a3, a2, name in entries]
+    lines += ["})", ""]
+
+    with open(OUTPUT_PATH, "w") as f:
+        f.write("\n".join(lines))
+    print(f"Wrote {len(entries)} entries to {OUTPUT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,37 +14,57 @@ Usage:
     # First N rows only:
     python eval_spirit_guess_commonlid.py --limit 5000
 
+    # Cache the test split locally so later runs skip the download:
+    python eval_spirit_guess_commonlid.py --cache-path commonlid_test.parquet
+
+    # Spread detection over 8 processes:
+    python eval_spirit_guess_commonlid.py --workers 8
+
+    # Predict 'un' without running the detector for texts under 10 chars:
+    python eval_spirit_guess_commonlid.py --min-length 10
+
+    # Prepare the dataset with 4 processes (default: number of CPUs):
+    python eval_spirit_guess_commonlid.py --num-proc 4
+
     # Use enchant detector instead of ngram:
     python eval_spirit_guess_commonlid.py --detector enchant --sample-per-lang 100
 """
 
 import argparse
+import inspect
+import itertools
 import json
+import os
 import random
 import sys
 import time
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from types import MappingProxyType
 
-import pycountry
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datasets import load_dataset
+from spirit_guess.ngram_detect import NgramDetect
+from spirit_guess.ngram_model import TRIGRAM_MODEL
 
+from language_codes import SPIRIT_GUESS_CODES
+from static_tag_map import STATIC_TAG_MAP
+
+try:
+    import orjson  # optional: faster results serialization
+except ImportError:
+    orjson = None
 
-# ---- Language code mapping ----
 
-# Spirit-guess supported codes (from spirit_guess.languages.SUPPORTED_LANGUAGES)
-SPIRIT_GUESS_CODES = {
-    "af", "ar", "az", "bg", "bn", "bo", "ca", "ceb", "cs", "cy", "da", "de",
-    "el", "en", "eo", "es", "et", "eu", "fa", "fi", "fr", "gu", "ha", "haw",
-    "he", "hi", "hr", "hu", "hy", "id", "is", "it", "ka", "kk", "km", "ky",
-    "la", "lt", "lv", "mk", "ml", "mn", "mr", "nb", "nr", "ne", "nl", "nso",
-    "pa", "pl", "ps", "pt", "pt_PT", "pt_BR", "ro", "ru", "sk", "sl", "so",
-    "sq", "sr", "ss", "st", "sv", "sw", "te", "th", "tl", "tlh", "tn", "tr",
-    "ts", "uk", "ur", "uz", "ve", "vi", "xh", "zu",
-}
+# ---- Language code mapping ----
 
 # Manual mappings for codes pycountry can't resolve automatically.
+# Everything pycountry can resolve is precomputed in static_tag_map.py.
 # Maps CommonLID ISO 639-3 → spirit-guess code.
-MANUAL_MAPPING = {
+MANUAL_MAPPING = MappingProxyType({
     # Arabic varieties → ar
     "arb": "ar",   # Standard Arabic
     "arz": "ar",   # Egyptian Arabic
@@ -64,7 +84,79 @@ MANUAL_MAPPING = {
     "gaz": "om",   # West Central Oromo → Oromo (om not in spirit-guess)
     # Direct 3-letter code match
     "nso": "nso",  # Pedi — spirit-guess uses this code directly
-}
+})
+
+# Number of texts handed to ``detector.detect_batch`` per call.
+BATCH_SIZE = 1024
+
+# Number of wrong predictions kept (reservoir-sampled) in the results.
+N_SAMPLE_ERRORS = 20
+
+# Print progress every 8192 rows; a power of two so the check is a bit mask.
+PROGRESS_MASK = 8192 - 1
+
+# Columns kept in the local Parquet cache of the test split.
+CACHE_SCHEMA = pa.schema([("tag", pa.string()), ("text", pa.string())])
+CACHE_BATCH_ROWS = 50000
+
+
+# ---- Dataset loading ----
+
+def _hub_rows(limit=None, num_proc=None):
+    if limit:
+        # A --limit run only needs the first rows, so stream them rather
+        # than preparing the whole split.
+        ds = load_dataset("commoncrawl/CommonLID", split="test", streaming=True)
+        for row in ds.select_columns(list(CACHE_SCHEMA.names)):
+            yield row["tag"], row["text"]
+        return
+
+    # Full runs load non-streaming: shards are downloaded and prepared in
+    # parallel into the local Arrow cache, then read back column-wise.
+    ds = load_dataset("commoncrawl/CommonLID", split="test", num_proc=num_proc)
+    ds = ds.select_columns(list(CACHE_SCHEMA.names))
+    for batch in ds.iter(batch_size=CACHE_BATCH_ROWS):
+        yield from zip(batch["tag"], batch["text"])
+
+
+def _read_cache(cache_path):
+    for batch in pq.ParquetFile(cache_path).iter_batches(
+            batch_size=CACHE_BATCH_ROWS, columns=CACHE_SCHEMA.names):
+        yield from zip(batch.column("tag").to_pylist(),
+                       batch.column("text").to_pylist())
+
+
+def _write_cache(rows, cache_path):
+    """Pass rows through while writing them to ``cache_path``."""
+    tmp_path = cache_path + ".tmp"
+    with pq.ParquetWriter(tmp_path, CACHE_SCHEMA) as writer:
+        while batch := list(itertools.islice(rows, CACHE_BATCH_ROWS)):
+            tags, texts = zip(*batch)
+            writer.write_table(pa.table([list(tags), list(texts)], schema=CACHE_SCHEMA))
+            yield from batch
+    # Only publish the cache once the whole split has been written.
+    os.replace(tmp_path, cache_path)
+
+
+def load_rows(limit=None, cache_path=None, num_proc=None):
+    """Yield CommonLID test rows as (tag, text) tuples, dropping other columns.
+
+    With ``cache_path``, rows are read from that Parquet file if it exists;
+    otherwise the split is loaded from the Hub once and saved there for
+    later runs. ``num_proc`` processes prepare the Hub dataset on full runs;
+    ``limit`` runs stream just the rows they need.
+    """
+    if cache_path and os.path.exists(cache_path):
+        print(f"Reading cached CommonLID test split from {cache_path}...")
+        rows = _read_cache(cache_path)
+    else:
+        print("Loading CommonLID dataset...")
+        rows = _hub_rows(limit, num_proc)
+        # A --limit run only sees part of the split, so don't cache it.
+        if cache_path and not limit:
+            print(f"Caching test split to {cache_path}...")
+            rows = _write_cache(rows, cache_path)
+    return itertools.islice(rows, limit or None)
 
 
 def build_mapping(commonlid_tags):
@@ -79,131 +171,315 @@ def build_mapping(commonlid_tags):
                 mapping[tag] = sg_code
             continue
 
-        # Try pycountry automatic lookup
+        # Fall back to the table precomputed from pycountry
+        if tag in STATIC_TAG_MAP:
+            mapping[tag] = STATIC_TAG_MAP[tag]
+
+    return mapping
+
+
+class BatchNgramDetect(NgramDetect):
+    """NgramDetect with a NumPy-vectorized ``detect_batch``.
+
+    Scores are the same out-of-place rank distances ``NgramDetect.detect``
+    computes, but a whole batch is scored against every language at once:
+    each text's top trigrams are looked up in a dense (trigram, language) rank
+    table and the distances are summed per text with ``np.add.reduceat``.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # Keep the parent's set iteration order so ties resolve identically.
+        self._lang_order = list(self._languages)
+        self._vocab = {}
+        for lang in self._lang_order:
+            for trigram in TRIGRAM_MODEL[lang]:
+                self._vocab.setdefault(tuple(trigram), len(self._vocab))
+
+        # Rank of each trigram in each language profile, -1 when absent.
+        # The extra last row stands for trigrams no profile contains.
+        self._ranks = np.full((len(self._vocab) + 1, len(self._lang_order)), -1,
+                              dtype=np.int32)
+        for j, lang in enumerate(self._lang_order):
+            for rank, trigram in reversed(list(enumerate(TRIGRAM_MODEL[lang]))):
+                self._ranks[self._vocab[tuple(trigram)], j] = rank
+
+    def detect_batch(self, texts, min_len=20, max_ngrams=300):
+        """Return (pred_code, pred_score) for each text, like ``detect``."""
+        results = [("un", 0.0)] * len(texts)
+        oov = len(self._vocab)
+        rows, offsets, ids, positions = [], [], [], []
+        for row, text in enumerate(texts):
+            if len(text) <= min_len:
+                continue
+            top = self.ngram_count(text).most_common(max_ngrams)
+            rows.append(row)
+            offsets.append(len(ids))
+            ids.extend(self._vocab.get(ng, oov) for ng, _ in top)
+            positions.extend(range(len(top)))
+
+        if not rows or not self._lang_order:
+            return results
+
+        # Turn the gathered ranks into distances in place: this is the one
+        # (n_trigrams, n_langs) array per batch, so avoid temporaries of it.
+        dist = self._ranks[ids]
+        missing = dist < 0
+        dist -= np.array(positions, dtype=np.int32)[:, None]
+        np.abs(dist, out=dist)
+        dist[missing] = max_ngrams
+        # Sum in int32 (at most max_ngrams ** 2 per text); the default int64
+        # accumulator would copy the whole array first.
+        scores = np.add.reduceat(dist, offsets, axis=0, dtype=np.int32)
+        # NgramDetect.detect keeps the last of several equally low scores.
+        n_langs = len(self._lang_order)
+        best = n_langs - 1 - np.argmin(scores[:, ::-1], axis=1)
+        best_scores = scores[np.arange(len(rows)), best]
+        for row, b, score in zip(rows, best.tolist(), best_scores.tolist()):
+            results[row] = (self._lang_order[b], score)
+        return results
+
+
+def _detect_each(detector, texts):
+    for text in texts:
         try:
-            lang = pycountry.languages.get(alpha_3=tag)
-            if lang and hasattr(lang, "alpha_2"):
-                a2 = lang.alpha_2
-                if a2 in SPIRIT_GUESS_CODES:
-                    mapping[tag] = a2
+            yield detector.detect(text)
         except Exception:
-            pass
+            yield "error", 0.0
 
-    return mapping
 
+def detect_all(detector, texts, batch_size=BATCH_SIZE):
+    """Yield (pred_code, pred_score) for each text, batching when supported."""
+    if not hasattr(detector, "detect_batch"):
+        yield from _detect_each(detector, texts)
+        return
 
-def evaluate(detector_type="ngram", limit=None, sample_per_lang=None,
-             output_path=None, seed=42):
-    # Load detector
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        try:
+            preds = detector.detect_batch(batch)
+        except Exception:
+            # Redo the batch text by text so only the failing texts
+            # are recorded as errors.
+            preds = _detect_each(detector, batch)
+        yield from preds
+
+
+def load_detector(detector_type):
+    """Construct the spirit-guess detector, or return None if unknown."""
     if detector_type == "ngram":
-        from spirit_guess.ngram_detect import NgramDetect
-        detector = NgramDetect()
-    elif detector_type == "enchant":
+        return BatchNgramDetect()
+    if detector_type == "enchant":
         from spirit_guess.enchant_detect import EnchantDetect
-        detector = EnchantDetect()
-    else:
+        return EnchantDetect()
+    return None
+
+
+def detector_min_length(detector):
+    """Shortest text the detector scores, from its ``min_len`` default."""
+    param = inspect.signature(detector.detect).parameters.get("min_len")
+    if param is None or param.default is param.empty:
+        return 0
+    # Texts of length <= min_len come back as unknown.
+    return param.default + 1
+
+
+# Detector owned by each worker process, built once by _init_worker.
+_worker_detector = None
+
+
+def _init_worker(detector_type):
+    global _worker_detector
+    _worker_detector = load_detector(detector_type)
+
+
+def _detect_chunk(texts):
+    return list(detect_all(_worker_detector, texts))
+
+
+def predict(detector, detector_type, texts, workers=1, batch_size=BATCH_SIZE):
+    """Yield (pred_code, pred_score) for each text, in order.
+
+    With ``workers > 1``, chunks of ``batch_size`` texts are fanned out to a
+    process pool; each worker constructs its own detector once.
+    """
+    if workers <= 1:
+        yield from detect_all(detector, texts, batch_size)
+        return
+
+    chunks = [texts[start:start + batch_size]
+              for start in range(0, len(texts), batch_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(detector_type,)) as executor:
+        for preds in executor.map(_detect_chunk, chunks):
+            yield from preds
+
+
+def write_results(results, output_path):
+    """Write results as indented JSON, using orjson when it is installed."""
+    if orjson is not None:
+        with open(output_path, "wb") as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+        return
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+def evaluate(detector_type="ngram", limit=None, sample_per_lang=None,
+             output_path=None, seed=42, cache_path=None, workers=1,
+             min_length=None, num_proc=None):
+    # Load detector
+    detector = load_detector(detector_type)
+    if detector is None:
         print(f"Unknown detector type: {detector_type}")
         sys.exit(1)
+    if min_length is None:
+        min_length = detector_min_length(detector)
 
-    # Load dataset
-    print("Loading CommonLID dataset...")
-    ds = load_dataset("commoncrawl/CommonLID", split="test", streaming=True)
-
+    # Load dataset, keeping only rows with a spirit-guess mapping. With
+    # sample_per_lang, each language keeps a reservoir sample (Algorithm R)
+    # so at most sample_per_lang rows per language are ever held in memory.
+    rng = random.Random(seed)
     all_tags = set()
-    rows = []
-    print("Streaming dataset...")
-    for i, row in enumerate(ds):
-        if limit and i >= limit:
-            break
-        all_tags.add(row["tag"])
-        rows.append(row)
-        if (i + 1) % 50000 == 0:
-            print(f"  loaded {i + 1} rows...")
-
-    print(f"Total rows loaded: {len(rows)}")
+    tag_map = {}
+    eval_rows = []
+    by_lang = defaultdict(list)
+    seen_per_lang = Counter()
+    n_rows = 0
+    for row in load_rows(limit, cache_path, num_proc):
+        n_rows += 1
+        if n_rows % 50000 == 0:
+            print(f"  loaded {n_rows} rows...")
+
+        tag = row[0]
+        if tag not in all_tags:
+            all_tags.add(tag)
+            tag_map.update(build_mapping([tag]))
+        if tag not in tag_map:
+            continue
+
+        seen_per_lang[tag] += 1
+        if not sample_per_lang:
+            eval_rows.append(row)
+            continue
+        reservoir = by_lang[tag]
+        if len(reservoir) < sample_per_lang:
+            reservoir.append(row)
+        else:
+            j = rng.randrange(seen_per_lang[tag])
+            if j < sample_per_lang:
+                reservoir[j] = row
+
+    print(f"Total rows loaded: {n_rows}")
     print(f"Unique tags in data: {len(all_tags)}")
 
-    # Build mapping
-    tag_map = build_mapping(all_tags)
-    mapped_tags = set(tag_map.keys())
-    unmapped_tags = all_tags - mapped_tags
-    print(f"Tags mappable to spirit-guess: {len(mapped_tags)}")
+    # spirit-guess may return pt_BR or pt_PT, so compare on the root code;
+    # tag_map keeps the full code for reporting.
+    tag_map_root = {tag: code.partition("_")[0] for tag, code in tag_map.items()}
+    unmapped_tags = all_tags - tag_map.keys()
+    print(f"Tags mappable to spirit-guess: {len(tag_map)}")
     if unmapped_tags:
         print(f"Unmapped tags ({len(unmapped_tags)}): {sorted(unmapped_tags)}")
 
-    # Filter to evaluable rows
-    eval_rows = [r for r in rows if r["tag"] in tag_map]
-    skipped = len(rows) - len(eval_rows)
-    print(f"Evaluable rows: {len(eval_rows)} (skipped {skipped} with unmapped tags)")
+    n_evaluable = sum(seen_per_lang.values())
+    skipped = n_rows - n_evaluable
+    print(f"Evaluable rows: {n_evaluable} (skipped {skipped} with unmapped tags)")
 
     # Optionally subsample per language for balanced, faster evaluation
     if sample_per_lang:
-        rng = random.Random(seed)
-        by_lang = defaultdict(list)
-        for r in eval_rows:
-            by_lang[r["tag"]].append(r)
-        sampled = []
-        for tag, tag_rows in by_lang.items():
-            if len(tag_rows) <= sample_per_lang:
-                sampled.extend(tag_rows)
-            else:
-                sampled.extend(rng.sample(tag_rows, sample_per_lang))
-        rng.shuffle(sampled)
-        print(f"Sampled {len(sampled)} rows ({sample_per_lang}/lang, "
+        eval_rows = [r for tag_rows in by_lang.values() for r in tag_rows]
+        print(f"Sampled {len(eval_rows)} rows ({sample_per_lang}/lang, "
               f"{len(by_lang)} langs)")
-        eval_rows = sampled
 
     # Run evaluation
     print(f"\nRunning {detector_type} detector...")
     correct = 0
-    total = 0
-    per_lang_correct = Counter()
-    per_lang_total = Counter()
-    errors = []  # track some wrong predictions for analysis
+    # Every gold tag is in tag_map, so plain dicts can be seeded up front.
+    per_lang_correct = dict.fromkeys(tag_map, 0)
+    per_lang_total = dict.fromkeys(tag_map, 0)
+    # Reservoir sample of wrong predictions as (row index, pred, score);
+    # texts are looked up only when building the results.
+    errors = []
     unknown_count = 0
 
-    t0 = time.time()
-    for i, row in enumerate(eval_rows):
-        text = row["text"]
-        gold_639_3 = row["tag"]
-        gold_639_1 = tag_map[gold_639_3]
-
-        try:
-            pred_code, pred_score = detector.detect(text)
-        except Exception as e:
-            pred_code = "error"
-            pred_score = 0.0
+    # Process texts shortest first so each detector batch holds texts of
+    # similar length (and similar trigram counts).
+    eval_rows.sort(key=lambda row: len(row[1]))
+    golds = [tag for tag, _ in eval_rows]
+    texts = [text for _, text in eval_rows]
+    n_eval = len(texts)
+
+    # Detect each distinct text once; repeats (boilerplate, navigation
+    # snippets, ...) reuse the earlier prediction.
+    unique_texts = list(dict.fromkeys(texts))
+    print(f"Unique texts: {len(unique_texts)} "
+          f"({n_eval - len(unique_texts)} duplicates skipped)")
+    # Texts too short to score are unknown without calling the detector.
+    pred_by_text = {text: ("un", 0.0) for text in unique_texts
+                    if len(text) < min_length}
+    unique_texts = [text for text in unique_texts if len(text) >= min_length]
+    print(f"Texts shorter than {min_length} chars: {len(pred_by_text)}")
+
+    # Throughput and ETA are measured in detector calls, not rows: short and
+    # duplicate texts are accounted for almost for free.
+    n_detect = len(unique_texts)
+    n_detected = n_detected_last = 0
+    ema_rate = None
+
+    t0 = t_last = time.perf_counter()
+    predictions = predict(detector, detector_type, unique_texts, workers)
+    for i, (text, gold_639_3) in enumerate(zip(texts, golds), 1):
+        pred = pred_by_text.get(text)
+        if pred is None:
+            # unique_texts is in first-occurrence order, so an unseen text is
+            # always the next one predicted.
+            pred = pred_by_text[text] = next(predictions)
+            n_detected += 1
+        pred_code, pred_score = pred
 
         if pred_code == "un":
             unknown_count += 1
 
-        # Normalize: spirit-guess may return pt_BR or pt_PT, map to pt for comparison
-        pred_normalized = pred_code.split("_")[0] if "_" in pred_code else pred_code
-        gold_normalized = gold_639_1.split("_")[0] if "_" in gold_639_1 else gold_639_1
-
-        is_correct = pred_normalized == gold_normalized
+        is_correct = pred_code.partition("_")[0] == tag_map_root[gold_639_3]
         if is_correct:
             correct += 1
             per_lang_correct[gold_639_3] += 1
-        elif len(errors) < 100:
-            errors.append({
-                "text": text[:200],
-                "gold": gold_639_3,
-                "gold_639_1": gold_639_1,
-                "pred": pred_code,
-                "score": pred_score,
-            })
-
-        total += 1
-        per_lang_total[gold_639_3] += 1
+        elif len(errors) < N_SAMPLE_ERRORS:
+            errors.append((i - 1, pred_code, pred_score))
+        else:
+            j = rng.randrange(i - correct)
+            if j < N_SAMPLE_ERRORS:
+                errors[j] = (i - 1, pred_code, pred_score)
 
-        if (i + 1) % 10000 == 0:
-            elapsed = time.time() - t0
-            rate = (i + 1) / elapsed
-            acc_so_far = correct / total * 100
-            print(f"  {i + 1}/{len(eval_rows)} ({rate:.0f} rows/sec) — accuracy so far: {acc_so_far:.1f}%")
+        per_lang_total[gold_639_3] += 1
 
-    elapsed = time.time() - t0
+        if not i & PROGRESS_MASK:
+            # Smooth the detection rate over report intervals; it drifts as
+            # texts get longer, so the ETA follows the recent rate. Intervals
+            # without detector calls say nothing about it and are skipped.
+            now = time.perf_counter()
+            if n_detected > n_detected_last:
+                rate = (n_detected - n_detected_last) / (now - t_last)
+                ema_rate = rate if ema_rate is None else 0.9 * ema_rate + 0.1 * rate
+            t_last, n_detected_last = now, n_detected
+            if ema_rate is None:
+                speed = "ETA unknown"
+            else:
+                eta = timedelta(seconds=round((n_detect - n_detected) / ema_rate))
+                speed = f"{ema_rate:.0f} texts/sec, ETA {eta}"
+            print(f"  {i}/{n_eval} rows, {n_detected}/{n_detect} texts detected "
+                  f"({speed}) — accuracy so far: {correct / i * 100:.1f}%")
+
+    total = n_eval
+    elapsed = time.perf_counter() - t0
+
+    sample_errors = [{
+        "text": texts[idx][:200],
+        "gold": golds[idx],
+        "gold_639_1": tag_map[golds[idx]],
+        "pred": pred_code,
+        "score": pred_score,
+    } for idx, pred_code, pred_score in sorted(errors)]
 
     # Compute per-language accuracy
     per_lang_results = {}
@@ -244,12 +520,11 @@ def evaluate(detector_type="ngram", limit=None, sample_per_lang=None,
         "languages_evaluated": len(per_lang_total),
         "elapsed_seconds": elapsed,
         "per_language": per_lang_results,
-        "sample_errors": errors[:20],
+        "sample_errors": sample_errors,
     }
 
     if output_path:
-        with open(output_path, "w") as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+        write_results(results, output_path)
         print(f"\nFull results saved to {output_path}")
 
     return results
@@ -267,6 +542,17 @@ if __name__ == "__main__":
                         help="Random seed for sampling (default: 42)")
     parser.add_argument("--output", type=str, default=None,
                         help="Path to save JSON results")
+    parser.add_argument("--cache-path", type=str, default=None,
+                        help="Parquet file caching the test split; written on the "
+                             "first full run, read on later runs (default: no cache)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Detector processes to run in parallel (default: 1)")
+    parser.add_argument("--min-length", type=int, default=None,
+                        help="Predict 'un' without running the detector for texts "
+                             "shorter than this (default: the detector's own minimum)")
+    parser.add_argument("--num-proc", type=int, default=os.cpu_count(),
+                        help="Processes used to prepare the dataset "
+                             "(default: number of CPUs)")
     args = parser.parse_args()
 
     evaluate(
@@ -275,4 +561,8 @@ if __name__ == "__main__":
         sample_per_lang=args.sample_per_lang,
         output_path=args.output,
         seed=args.seed,
+        cache_path=args.cache_path,
+        workers=args.workers,
+        min_length=args.min_length,
+        num_proc=args.num_proc,
     )
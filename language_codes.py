@@ -0,0 +1,17 @@
+"""
+Language codes supported by spirit-guess.
+
+Kept free of third-party imports so build_static_tag_map.py can read it
+without loading evaluate.py or the generated table.
+"""
+
+# Spirit-guess supported codes (from spirit_guess.languages.SUPPORTED_LANGUAGES)
+SPIRIT_GUESS_CODES = frozenset({
+    "af", "ar", "az", "bg", "bn", "bo", "ca", "ceb", "cs", "cy", "da", "de",
+    "el", "en", "eo", "es", "et", "eu", "fa", "fi", "fr", "gu", "ha", "haw",
+    "he", "hi", "hr", "hu", "hy", "id", "is", "it", "ka", "kk", "km", "ky",
+    "la", "lt", "lv", "mk", "ml", "mn", "mr", "nb", "nr", "ne", "nl", "nso",
+    "pa", "pl", "ps", "pt", "pt_PT", "pt_BR", "ro", "ru", "sk", "sl", "so",
+    "sq", "sr", "ss", "st", "sv", "sw", "te", "th", "tl", "tlh", "tn", "tr",
+    "ts", "uk", "ur", "uz", "ve", "vi", "xh", "zu",
+})
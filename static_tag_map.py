@@ -0,0 +1,85 @@
+"""
+ISO 639-3 → spirit-guess code for every language pycountry resolves to a
+code in SPIRIT_GUESS_CODES.
+
+Generated by build_static_tag_map.py (pycountry 26.2.16);
+do not edit by hand.
+"""
+
+from types import MappingProxyType
+
+STATIC_TAG_MAP = MappingProxyType({
+    "afr": "af",  # Afrikaans
+    "ara": "ar",  # Arabic
+    "aze": "az",  # Azerbaijani
+    "ben": "bn",  # Bengali
+    "bod": "bo",  # Tibetan
+    "bul": "bg",  # Bulgarian
+    "cat": "ca",  # Catalan
+    "ces": "cs",  # Czech
+    "cym": "cy",  # Welsh
+    "dan": "da",  # Danish
+    "deu": "de",  # German
+    "ell": "el",  # Modern Greek (1453-)
+    "eng": "en",  # English
+    "epo": "eo",  # Esperanto
+    "est": "et",  # Estonian
+    "eus": "eu",  # Basque
+    "fas": "fa",  # Persian
+    "fin": "fi",  # Finnish
+    "fra": "fr",  # French
+    "guj": "gu",  # Gujarati
+    "hau": "ha",  # Hausa
+    "heb": "he",  # Hebrew
+    "hin": "hi",  # Hindi
+    "hrv": "hr",  # Croatian
+    "hun": "hu",  # Hungarian
+    "hye": "hy",  # Armenian
+    "ind": "id",  # Indonesian
+    "isl": "is",  # Icelandic
+    "ita": "it",  # Italian
+    "kat": "ka",  # Georgian
+    "kaz": "kk",  # Kazakh
+    "khm": "km",  # Khmer
+    "kir": "ky",  # Kirghiz
+    "lat": "la",  # Latin
+    "lav": "lv",  # Latvian
+    "lit": "lt",  # Lithuanian
+    "mal": "ml",  # Malayalam
+    "mar": "mr",  # Marathi
+    "mkd": "mk",  # Macedonian
+    "mon": "mn",  # Mongolian
+    "nbl": "nr",  # South Ndebele
+    "nep": "ne",  # Nepali (macrolanguage)
+    "nld": "nl",  # Dutch
+    "nob": "nb",  # Norwegian Bokmål
+    "pan": "pa",  # Panjabi
+    "pol": "pl",  # Polish
+    "por": "pt",  # Portuguese
+    "pus": "ps",  # Pushto
+    "ron": "ro",  # Romanian
+    "rus": "ru",  # Russian
+    "slk": "sk",  # Slovak
+    "slv": "sl",  # Slovenian
+    "som": "so",  # Somali
+    "sot": "st",  # Southern Sotho
+    "spa": "es",  # Spanish
+    "sqi": "sq",  # Albanian
+    "srp": "sr",  # Serbian
+    "ssw": "ss",  # Swati
+    "swa": "sw",  # Swahili (macrolanguage)
+    "swe": "sv",  # Swedish
+    "tel": "te",  # Telugu
+    "tgl": "tl",  # Tagalog
+    "tha": "th",  # Thai
+    "tsn": "tn",  # Tswana
+    "tso": "ts",  # Tsonga
+    "tur": "tr",  # Turkish
+    "ukr": "uk",  # Ukrainian
+    "urd": "ur",  # Urdu
+    "uzb": "uz",  # Uzbek
+    "ven": "ve",  # Venda
+    "vie": "vi",  # Vietnamese
+    "xho": "xh",  # Xhosa
+    "zul": "zu",  # Zulu
+})